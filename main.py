@@ -19,7 +19,7 @@ Key Features
   command is invoked (or via inline buttons), the bot returns
   these titles in a neatly formatted list.
 * **Website status check** – The `/status` command performs a
-  simple HTTP GET request to the home page to determine whether
+  simple HTTP HEAD request to the home page to determine whether
   the site is reachable.  If the request succeeds, it replies
   that the site is online; otherwise it reports that the site is
   under maintenance.
@@ -27,7 +27,7 @@ Key Features
   they start interacting with the bot.  An admin can change this
   code on the fly via `/change_invite <code>`.  Users can also
   request the current code at any time using `/invite`.
-* **Administrative controls** – A list of admin user IDs is
+* **Administrative controls** – A set of admin user IDs is
   defined in the `ADMIN_IDS` constant.  Admins can ban, block or
   flag users by ID using `/ban`, `/block` or `/flag` commands.
   Banned users will be silently ignored by the bot.  Blocked
@@ -38,7 +38,7 @@ To deploy this bot on Replit or any other Python environment,
 install the following dependencies:
 
 ```
-pip install python-telegram-bot==20.3 requests beautifulsoup4
+pip install "python-telegram-bot[http2,job-queue,webhooks]==20.3" httpx beautifulsoup4 cachetools orjson
 ```
 
 Replace `YOUR_BOT_TOKEN` below with your actual Telegram bot token
@@ -52,15 +52,23 @@ edit the `MOVIES` and `SERIES` lists accordingly.
 """
 
 import os
+import re
+import html
+import time
+import atexit
+import asyncio
 import logging
+import weakref
+import itertools
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import List, Optional, Dict, Any
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Callable, Iterable, Iterator, Tuple
 
-import requests
-import psycopg2
-import json
-from bs4 import BeautifulSoup
+import httpx
+import orjson
+from cachetools import TTLCache
 from telegram import (
     Update,
     InlineKeyboardButton,
@@ -69,12 +77,22 @@ from telegram import (
 )
 from telegram.ext import (
     Application,
+    ApplicationHandlerStop,
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
+    Defaults,
     MessageHandler,
+    TypeHandler,
     filters,
 )
+from telegram.request import HTTPXRequest
+
+# psycopg2 and BeautifulSoup are imported inside the functions that
+# use them, so the bot starts faster and uses less memory when there is no
+# database configured or the scraper is never called.
+if TYPE_CHECKING:
+    from psycopg2.pool import ThreadedConnectionPool
 
 
 # -----------------------------------------------------------------------------
@@ -92,36 +110,111 @@ TOKEN: Optional[str] = os.getenv("BOT_TOKEN")
 # Database connection
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
-# List of Telegram user IDs who have administrative privileges.  Replace
+# Public https base URL of this deployment.  When set, Telegram pushes
+# updates to a webhook served on PORT instead of the bot long polling.
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+PORT = int(os.environ.get('PORT', '8443'))
+
+# Shared pool of PostgreSQL connections, created by init_database().  Reusing
+# connections avoids a TCP + TLS + auth handshake on every query.
+DB_POOL: Optional["ThreadedConnectionPool"] = None
+
+# Server-side prepared statements for the bot_data table.  They are created
+# once per pooled connection (see prepare_bot_data_statements) so Postgres
+# skips parsing and planning on every save/load.
+BOT_DATA_PREPARE_SQL = '''
+    PREPARE bot_data_upsert(text, text) AS
+        INSERT INTO bot_data (data_type, content) VALUES ($1, $2)
+        ON CONFLICT (data_type) DO UPDATE SET content = EXCLUDED.content;
+    PREPARE bot_data_select(text) AS
+        SELECT content FROM bot_data WHERE data_type = $1;
+'''
+# Pooled connections on which BOT_DATA_PREPARE_SQL has already run
+_prepared_connections: "weakref.WeakSet" = weakref.WeakSet()
+
+# bot_data keys changed since the last flush.  Handlers call mark_dirty()
+# instead of saving immediately, and flush_dirty_data() writes all pending
+# keys in one batch every DIRTY_FLUSH_INTERVAL seconds.
+DIRTY_FLUSH_INTERVAL = 5
+_dirty: set[str] = set()
+# Flushes run one at a time so writes of the same key commit in order
+_flush_lock = asyncio.Lock()
+# Tickets are user submissions, so they are flushed this many seconds after
+# a change instead of waiting for the next DIRTY_FLUSH_INTERVAL tick
+TICKET_FLUSH_DELAY = 0.5
+_ticket_flush_scheduled = False
+
+# Shared asynchronous HTTP client used for website probes.  Requests are
+# awaited on the event loop instead of blocking every other handler, and
+# connections are kept alive between probes so repeated checks skip the
+# TCP + TLS handshake.
+HTTP_CLIENT = httpx.AsyncClient(
+    timeout=10,
+    limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+    # Like requests, follow redirects (e.g. netlify.app -> custom domain)
+    follow_redirects=True,
+)
+
+# Website checked by /status
+SITE_URL = "https://captainm.netlify.app"
+# A job re-probes the website every STATUS_REFRESH_INTERVAL seconds so
+# /status normally answers from the cache.  Entries older than
+# STATUS_CACHE_TTL (e.g. if the job fell behind) are re-probed on demand.
+STATUS_REFRESH_INTERVAL = 30.0
+STATUS_CACHE_TTL = 2 * STATUS_REFRESH_INTERVAL
+# Map url -> (time.monotonic() of the probe, HTTP status code or None if the
+# site could not be reached)
+_status_cache: Dict[str, Tuple[float, Optional[int]]] = {}
+_status_lock = asyncio.Lock()
+
+# Set of Telegram user IDs who have administrative privileges.  Replace
 # the example IDs with actual numeric IDs.  Admins can ban/block/flag users
-# and change the invite code.
-ADMIN_IDS: List[int] = [123456789, 987654321, 5506657489]
+# and change the invite code.  A frozenset makes the admin check O(1).
+ADMIN_IDS: frozenset[int] = frozenset({123456789, 987654321, 5506657489})
 
 
 # Invite code shown to regular users.  Admins can change this value at
 # runtime via the /change_invite command.
 invite_code: str = "ABCDEF"
 
-# In‑memory data structures for tracking user status.  You could persist
-# these sets to disk (e.g. JSON file) for a long‑running bot, but for
-# simplicity they live in RAM.
-banned_users: set[int] = set()
-blocked_users: set[int] = set()
-flagged_users: set[int] = set()
-
-# Command toggle states - admins can enable/disable commands
-command_states = {
-    "movies": True,
-    "series": True,
-    "status": True,
-    "invite": True,
-    "help": True
+# In‑memory user status, stored as a bitmask per user ID so that every
+# handler needs a single dict lookup.  Users without an entry have no flags.
+BAN, BLOCK, FLAG = 1, 2, 4
+user_state: dict[int, int] = {}
+# Database writes for one user run one at a time (see set_user_state)
+_user_state_locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# Each status bit is mirrored by a database table with one row per user, so
+# a single ban/block/flag writes one row instead of re-saving every user.
+USER_STATE_TABLES: Dict[int, str] = {
+    BAN: "banned_users",
+    BLOCK: "blocked_users",
+    FLAG: "flagged_users",
 }
 
+# Command toggle states - admins can enable/disable commands.  Each command
+# has one bit in `cmd_flags`; a set bit means the command is enabled.
+MOVIES_BIT, SERIES_BIT, STATUS_BIT, INVITE_BIT, HELP_BIT = 1, 2, 4, 8, 16
+COMMAND_BITS: Dict[str, int] = {
+    "movies": MOVIES_BIT,
+    "series": SERIES_BIT,
+    "status": STATUS_BIT,
+    "invite": INVITE_BIT,
+    "help": HELP_BIT,
+}
+cmd_flags: int = MOVIES_BIT | SERIES_BIT | STATUS_BIT | INVITE_BIT | HELP_BIT
+
+# Pending multi-step inputs expire after this many seconds, so abandoned
+# flows don't pile up in memory
+PENDING_INPUT_TTL = 600
+
 # Temporary storage for admin commands waiting for user input
-waiting_for_input: dict[int, str] = {}
+waiting_for_input: TTLCache = TTLCache(maxsize=10_000, ttl=PENDING_INPUT_TTL)
 # Store additional context for admin operations
-admin_context: dict[int, dict] = {}
+admin_context: TTLCache = TTLCache(maxsize=10_000, ttl=PENDING_INPUT_TTL)
+# Updates are processed concurrently, so each admin's multi-step input flow
+# is guarded by a per-user lock (see expect_admin_input/handle_admin_input)
+_input_locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
 # Site status control - affects status command behavior
 site_status: bool = True  # True = ON, False = OFF
 
@@ -129,12 +222,58 @@ site_status: bool = True  # True = ON, False = OFF
 # Ticketing System Variables
 # ---------------------------------------------------------------------------
 
-# This list will hold all tickets.  Each ticket is a dict with:
-# id, user_id, user_link, category, message, timestamp, closed (bool)
-tickets: List[Dict[str, Any]] = []
+# Keyboards that never change, built once and reused for every message
+TICKET_CATEGORY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💡 اقتراح", callback_data="ticket_suggestion")],
+    [InlineKeyboardButton("⚠️ بلاغ", callback_data="ticket_report")],
+    [InlineKeyboardButton("📩 تحدث مع المالك", callback_data="ticket_owner")],
+])
+CLEAR_CLOSED_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🧹 حذف التذاكر المغلقة", callback_data="clear_closed_tickets")]
+])
+CLOSE_TICKET_LABEL = "🔒 إغلاق التذكرة"
+
+# Admin notification for a new ticket, filled from the ticket dict
+NEW_TICKET_TEMPLATE = (
+    "🎟️ **تذكرة جديدة**\n\n"
+    "**النوع:** {category}\n"
+    "**المرسل:** {user_link}\n"
+    "**الوقت:** {timestamp}\n"
+    "**الرسالة:**\n{message}"
+)
+
+# Callback data handled by handle_ticket_callback.  The named groups carry
+# the chosen category or the id of the ticket to close.
+TICKET_CALLBACK_PATTERN = re.compile(
+    r"^(?:ticket_(?P<category>\w+)|close_ticket_(?P<ticket_id>\d+)|clear_closed_tickets)$"
+)
+
+# Time zone used for ticket timestamps
+TICKET_TZ = ZoneInfo("Africa/Cairo")
+
+# All tickets keyed by their integer id, in creation order.  Each ticket is
+# a dict with: id, user_id, user_link, category, message, timestamp,
+# closed (bool)
+tickets: Dict[int, Dict[str, Any]] = {}
+
+# Ids of tickets that are still open, so closing and counting are O(1)
+open_tickets: set[int] = set()
+
+# user_id -> user_link of everyone with a ticket, in order of their first
+# ticket.  Rebuilt by index_ticket_users() whenever tickets are removed.
+ticket_users: Dict[int, str] = {}
+
+# Lowest id create_ticket() may hand out next.  Ids are time.time_ns()
+# values, so a ticket lost before it was saved can't have its id (and the
+# admins' close button for it) reissued after a restart.
+_next_ticket_id: int = 1
 
 # Map user_id -> category when waiting for the user to type their ticket message
-waiting_for_ticket: Dict[int, str] = {}
+waiting_for_ticket: TTLCache = TTLCache(maxsize=10_000, ttl=PENDING_INPUT_TTL)
+
+# Caps concurrent sends when notifying all admins, keeping the bot below
+# Telegram's global limit of about 30 messages per second
+_send_semaphore = asyncio.Semaphore(25)
 
 
 # Static catalog taken from Captain M website (as of Aug 2025).  Each
@@ -155,6 +294,30 @@ SERIES: List[str] = [
     "لعبة الحبار",
 ]
 
+# Labels used when rendering the movie and series catalogs.
+CATALOG_LABELS: Dict[str, Dict[str, str]] = {
+    "movies": {
+        "header": "🎬 <b>قائمة الأفلام المتاحة</b>",
+        "emoji": "🎞️",
+        "unit": "فيلم",
+        "empty": "🚫 <b>لا توجد أفلام متاحة حاليًا</b>",
+    },
+    "series": {
+        "header": "📺 <b>قائمة المسلسلات المتاحة</b>",
+        "emoji": "📽️",
+        "unit": "مسلسل",
+        "empty": "🚫 <b>لا توجد مسلسلات متاحة حاليًا</b>",
+    },
+}
+
+# Rendered catalog messages keyed by "movies"/"series".  An entry is built on
+# first use and dropped by invalidate_catalog() whenever its list changes.
+_rendered_catalog: Dict[str, str] = {}
+
+# Admin item-picker keyboards keyed by (kind, callback prefix), e.g.
+# ("movies", "del_movie_").  Dropped alongside the rendered catalog.
+_catalog_keyboards: Dict[Tuple[str, str], InlineKeyboardMarkup] = {}
+
 
 # -----------------------------------------------------------------------------
 # Helper functions
@@ -165,18 +328,78 @@ def user_is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
 
-def fetch_website_status(url: str = "https://captainm.netlify.app") -> bool:
-    """Check whether the target website is reachable.
+def chunk_lines(lines: Iterable[str], limit: int = 4000) -> Iterator[str]:
+    """Join `lines` with newlines into messages of at most `limit` characters.
 
-    Performs a simple GET request and returns True if the HTTP status
-    code is 200.  Any exception or non‑200 code is interpreted as the
-    site being down or under maintenance.
+    Telegram rejects messages over 4096 characters.  Chunks are only split
+    between lines, so Markdown entities within a line stay intact.
+    """
+    chunk: List[str] = []
+    size = 0
+    for line in lines:
+        if chunk and size + len(line) > limit:
+            yield "\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield "\n".join(chunk)
+
+
+async def _request_status(url: str) -> Optional[int]:
+    """Send a HEAD request to `url`, cache and return its status code.
+
+    Returns None if the request fails.  Callers hold `_status_lock`.
     """
     try:
-        response = requests.get(url, timeout=10)
-        return response.status_code == 200
-    except requests.RequestException:
-        return False
+        response = await HTTP_CLIENT.head(url)
+        status_code = response.status_code
+    except httpx.HTTPError:
+        status_code = None
+    _status_cache[url] = (time.monotonic(), status_code)
+    return status_code
+
+
+async def refresh_site_probe(_: object = None) -> None:
+    """Job callback: re-probe `SITE_URL` so /status can answer from the cache."""
+    # Nothing reads the probe while an admin has switched the site off
+    if not site_status:
+        return
+    async with _status_lock:
+        await _request_status(SITE_URL)
+
+
+async def probe_website(url: str = SITE_URL) -> Optional[int]:
+    """Return the HTTP status code of a HEAD request to the website.
+
+    Returns None if the request fails.  Results are cached for
+    `STATUS_CACHE_TTL` seconds and kept fresh by `refresh_site_probe`;
+    concurrent callers that miss the cache wait for a single shared request.
+    """
+    cached = _status_cache.get(url)
+    if cached and time.monotonic() - cached[0] < STATUS_CACHE_TTL:
+        return cached[1]
+    async with _status_lock:
+        # Another caller may have refreshed the entry while we waited
+        cached = _status_cache.get(url)
+        if cached and time.monotonic() - cached[0] < STATUS_CACHE_TTL:
+            return cached[1]
+        return await _request_status(url)
+
+
+async def fetch_website_status(url: str = SITE_URL) -> bool:
+    """Check whether the target website is reachable.
+
+    Returns True if the (cached) probe got HTTP status 200.  Any exception
+    or non‑200 code is interpreted as the site being down or under
+    maintenance.
+    """
+    return await probe_website(url) == 200
+
+
+async def close_http_client(application: Application) -> None:
+    """Close the shared HTTP client when the application shuts down."""
+    await HTTP_CLIENT.aclose()
 
 
 # -----------------------------------------------------------------------------
@@ -184,71 +407,126 @@ def fetch_website_status(url: str = "https://captainm.netlify.app") -> bool:
 # -----------------------------------------------------------------------------
 
 def init_database():
-    """Initialize database tables and load initial data."""
+    """Create the connection pool and initialize database tables."""
+    global DB_POOL
     if not DATABASE_URL:
         print("Warning: No DATABASE_URL found. Data will not persist between restarts.")
         return
     
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
+        from psycopg2.pool import ThreadedConnectionPool
+        
+        DB_POOL = ThreadedConnectionPool(1, 10, DATABASE_URL)
+        atexit.register(DB_POOL.closeall)
         
         # Create tables
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS bot_data (
-                id SERIAL PRIMARY KEY,
-                data_type VARCHAR(50) UNIQUE,
-                content TEXT
-            )
-        ''')
+        with db_cursor() as cur:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS bot_data (
+                    id SERIAL PRIMARY KEY,
+                    data_type VARCHAR(50) UNIQUE,
+                    content TEXT
+                )
+            ''')
+            for table in USER_STATE_TABLES.values():
+                cur.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        user_id BIGINT PRIMARY KEY
+                    )
+                ''')
+                # Move users saved by older versions as a JSON list in bot_data
+                cur.execute(f'''
+                    INSERT INTO {table} (user_id)
+                    SELECT jsonb_array_elements_text(content::jsonb)::bigint
+                    FROM bot_data WHERE data_type = %s
+                    ON CONFLICT DO NOTHING
+                ''', (table,))
+                cur.execute('DELETE FROM bot_data WHERE data_type = %s', (table,))
         
-        conn.commit()
-        cur.close()
-        conn.close()
         print("Database initialized successfully")
         
     except Exception as e:
         print(f"Database initialization failed: {e}")
 
+@contextmanager
+def db_cursor():
+    """Yield a cursor on a pooled connection, committing on success.
+
+    A connection that fails with a connection-level error is closed and
+    dropped from the pool instead of being handed out again.
+    """
+    import psycopg2
+
+    conn = DB_POOL.getconn()
+    broken = False
+    try:
+        with conn.cursor() as cur:
+            yield cur
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        DB_POOL.putconn(conn, close=broken or bool(conn.closed))
+
+def run_db(work: Callable[[Any], Any]) -> Any:
+    """Run `work(cur)` in one transaction and return its result.
+
+    Pooled connections are long-lived and the server may drop them while
+    idle.  If `work` fails on a dead connection it is retried once on a
+    fresh one, so the write isn't lost.
+    """
+    import psycopg2
+
+    try:
+        with db_cursor() as cur:
+            return work(cur)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        with db_cursor() as cur:
+            return work(cur)
+
+def prepare_bot_data_statements(cur) -> None:
+    """Prepare the bot_data statements on the cursor's connection if needed."""
+    if cur.connection not in _prepared_connections:
+        cur.execute(BOT_DATA_PREPARE_SQL)
+        _prepared_connections.add(cur.connection)
+
 def save_to_database(data_type: str, data):
     """Save data to database."""
-    if not DATABASE_URL:
+    if DB_POOL is None:
         return
     
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        
-        json_data = json.dumps(data, ensure_ascii=False)
-        cur.execute('''
-            INSERT INTO bot_data (data_type, content) VALUES (%s, %s)
-            ON CONFLICT (data_type) DO UPDATE SET content = EXCLUDED.content
-        ''', (data_type, json_data))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        json_data = orjson.dumps(data).decode()
+
+        def upsert(cur) -> None:
+            prepare_bot_data_statements(cur)
+            cur.execute('EXECUTE bot_data_upsert(%s, %s)', (data_type, json_data))
+
+        run_db(upsert)
         
     except Exception as e:
         print(f"Failed to save {data_type}: {e}")
 
 def load_from_database(data_type: str, default_value):
     """Load data from database."""
-    if not DATABASE_URL:
+    if DB_POOL is None:
         return default_value
     
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        cur = conn.cursor()
-        
-        cur.execute('SELECT content FROM bot_data WHERE data_type = %s', (data_type,))
-        result = cur.fetchone()
-        
-        cur.close()
-        conn.close()
+        def select(cur):
+            prepare_bot_data_statements(cur)
+            cur.execute('EXECUTE bot_data_select(%s)', (data_type,))
+            return cur.fetchone()
+
+        result = run_db(select)
         
         if result:
-            return json.loads(result[0])
+            return orjson.loads(result[0])
         else:
             # Save default value if not exists
             save_to_database(data_type, default_value)
@@ -258,45 +536,168 @@ def load_from_database(data_type: str, default_value):
         print(f"Failed to load {data_type}: {e}")
         return default_value
 
-def save_all_data():
-    """Save all bot data to database."""
-    global MOVIES, SERIES, banned_users, blocked_users, flagged_users
-    global invite_code, command_states, site_status, tickets
+def db_save_user_state(user_id: int, flags: int) -> None:
+    """Write one user's BAN/BLOCK/FLAG bits to `USER_STATE_TABLES`.
+
+    Only the rows for `user_id` are touched, in a single transaction.
+    """
+    if DB_POOL is None:
+        return
     
-    save_to_database('movies', MOVIES)
-    save_to_database('series', SERIES)
-    save_to_database('banned_users', list(banned_users))
-    save_to_database('blocked_users', list(blocked_users))
-    save_to_database('flagged_users', list(flagged_users))
-    save_to_database('invite_code', invite_code)
-    save_to_database('command_states', command_states)
-    save_to_database('site_status', site_status)
-    save_to_database('tickets', tickets)
+    def write(cur) -> None:
+        for flag, table in USER_STATE_TABLES.items():
+            if flags & flag:
+                cur.execute(
+                    f'INSERT INTO {table} (user_id) VALUES (%s) ON CONFLICT DO NOTHING',
+                    (user_id,),
+                )
+            else:
+                cur.execute(f'DELETE FROM {table} WHERE user_id = %s', (user_id,))
+
+    try:
+        run_db(write)
+    except Exception as e:
+        print(f"Failed to save state of user {user_id}: {e}")
+
+def load_user_ids(table: str) -> set[int]:
+    """Load all user IDs stored in a table from `USER_STATE_TABLES`."""
+    if DB_POOL is None:
+        return set()
+    
+    try:
+        def select(cur) -> set[int]:
+            cur.execute(f'SELECT user_id FROM {table}')
+            return {row[0] for row in cur.fetchall()}
+
+        return run_db(select)
+    except Exception as e:
+        print(f"Failed to load {table}: {e}")
+        return set()
+
+async def run_in_executor(func, *args):
+    """Run a blocking database helper in the default thread pool.
+
+    Async handlers use this so that JSON encoding and the PostgreSQL round
+    trip don't stall other updates on the event loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+def bot_data_snapshot(keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Return copies of the values stored in bot_data, optionally only `keys`.
+
+    Banned, blocked and flagged users are written row by row as they
+    change (see `db_save_user_state`) and are therefore not included.
+    """
+    snapshot = {
+        'movies': list(MOVIES),
+        'series': list(SERIES),
+        'invite_code': invite_code,
+        'command_states': cmd_flags,
+        'site_status': site_status,
+        'tickets': serialize_tickets(),
+    }
+    if keys is not None:
+        snapshot = {key: snapshot[key] for key in keys}
+    return snapshot
+
+def save_all_data(snapshot: Optional[Dict[str, Any]] = None) -> bool:
+    """Save bot data to database in a single transaction.
+
+    Writes `snapshot` (by default the full `bot_data_snapshot()`) with one
+    multi-row upsert.  Returns False if the write failed.
+    """
+    if DB_POOL is None:
+        return True
+    from psycopg2.extras import execute_values
+    
+    if snapshot is None:
+        snapshot = bot_data_snapshot()
+    if not snapshot:
+        return True
+    rows = [
+        (data_type, orjson.dumps(data).decode())
+        for data_type, data in snapshot.items()
+    ]
+    
+    try:
+        run_db(lambda cur: execute_values(cur, '''
+            INSERT INTO bot_data (data_type, content) VALUES %s
+            ON CONFLICT (data_type) DO UPDATE SET content = EXCLUDED.content
+        ''', rows))
+        return True
+    except Exception as e:
+        print(f"Failed to save bot data: {e}")
+        return False
+
+def mark_dirty(data_type: str) -> None:
+    """Schedule a bot_data key to be written on the next flush."""
+    _dirty.add(data_type)
+
+async def flush_dirty_data(_: object = None) -> None:
+    """Write every bot_data key marked dirty since the last flush.
+
+    Runs from the job queue every `DIRTY_FLUSH_INTERVAL` seconds and once
+    more when the application stops.  Keys whose write fails are marked
+    dirty again so the next flush retries them.
+    """
+    async with _flush_lock:
+        if not _dirty:
+            return
+        keys = list(_dirty)
+        _dirty.clear()
+        if not await run_in_executor(save_all_data, bot_data_snapshot(keys)):
+            _dirty.update(keys)
+
+def mark_tickets_dirty(job_queue) -> None:
+    """Mark the tickets dirty and flush them within `TICKET_FLUSH_DELAY`.
+
+    Ticket changes made before the flush runs share a single write.
+    """
+    global _ticket_flush_scheduled
+    mark_dirty('tickets')
+    if not _ticket_flush_scheduled:
+        _ticket_flush_scheduled = True
+        job_queue.run_once(_flush_tickets, TICKET_FLUSH_DELAY)
+
+async def _flush_tickets(_: object = None) -> None:
+    """Job callback for `mark_tickets_dirty`."""
+    global _ticket_flush_scheduled
+    _ticket_flush_scheduled = False
+    await flush_dirty_data()
 
 def load_all_data():
     """Load all bot data from database."""
-    global MOVIES, SERIES, banned_users, blocked_users, flagged_users
-    global invite_code, command_states, site_status, tickets
+    global MOVIES, SERIES, user_state
+    global invite_code, cmd_flags, site_status
     
     # Load movies and series with current data as default
     MOVIES = load_from_database('movies', MOVIES)
     SERIES = load_from_database('series', SERIES)
+    invalidate_catalog('movies')
+    invalidate_catalog('series')
     
-    # Load user lists
-    banned_users = set(load_from_database('banned_users', []))
-    blocked_users = set(load_from_database('blocked_users', []))
-    flagged_users = set(load_from_database('flagged_users', []))
+    # Load user lists, folding the per-table sets into one bitmask per user
+    user_state = {}
+    for flag, table in USER_STATE_TABLES.items():
+        for uid in load_user_ids(table):
+            user_state[uid] = user_state.get(uid, 0) | flag
     
     # Load settings
     invite_code = load_from_database('invite_code', invite_code)
-    command_states = load_from_database('command_states', command_states)
+    stored_flags = load_from_database('command_states', cmd_flags)
+    if isinstance(stored_flags, dict):
+        # Older versions stored {"movies": true, ...}; fold it into bits
+        stored_flags = sum(
+            bit for name, bit in COMMAND_BITS.items() if stored_flags.get(name, True)
+        )
+    cmd_flags = stored_flags
     site_status = load_from_database('site_status', site_status)
     
     # Load tickets
-    tickets = load_from_database('tickets', [])
+    load_tickets(load_from_database('tickets', serialize_tickets()))
 
 
-def parse_titles_from_page(url: str, selector: str = "h3") -> List[str]:
+async def parse_titles_from_page(url: str, selector: str = "h3") -> List[str]:
     """Attempt to scrape titles from a page on the Captain M site.
 
     This function is not currently used because the site loads data
@@ -312,30 +713,124 @@ def parse_titles_from_page(url: str, selector: str = "h3") -> List[str]:
     Returns:
         A list of unique title strings.
     """
+    from bs4 import BeautifulSoup
+    
     try:
-        resp = requests.get(url, timeout=10)
+        resp = await HTTP_CLIENT.get(url)
         soup = BeautifulSoup(resp.content, "html.parser")
         titles = [elem.get_text(strip=True) for elem in soup.select(selector)]
-        # Remove duplicates while preserving order
-        unique: List[str] = []
-        for t in titles:
-            if t and t not in unique:
-                unique.append(t)
-        return unique
-    except requests.RequestException:
+        # Remove empty and duplicate titles while preserving order
+        return list(dict.fromkeys(t for t in titles if t))
+    except httpx.HTTPError:
         return []
 
 
+# -----------------------------------------------------------------------------
+# User moderation
+# -----------------------------------------------------------------------------
+
+def get_user_state(user_id: int) -> int:
+    """Return the BAN/BLOCK/FLAG bitmask for a user (0 if none)."""
+    return user_state.get(user_id, 0)
+
+
+async def set_user_state(target_id: int, flags: int) -> None:
+    """Update a user's bitmask in memory and persist it off the event loop.
+
+    Writes for the same user are serialized and each stores the latest
+    bitmask, so quick successive changes can't commit out of order.
+    """
+    user_state[target_id] = flags
+    async with _user_state_locks[target_id]:
+        await run_in_executor(db_save_user_state, target_id, get_user_state(target_id))
+
+
+async def ban_user(target_id: int) -> None:
+    """Ban a user, clearing any block or flag, and persist the change."""
+    await set_user_state(target_id, BAN)
+
+
+async def block_user(target_id: int) -> None:
+    """Temporarily block a user and persist the change."""
+    await set_user_state(target_id, get_user_state(target_id) | BLOCK)
+
+
+async def flag_user(target_id: int) -> None:
+    """Flag a user for review and persist the change."""
+    await set_user_state(target_id, get_user_state(target_id) | FLAG)
+
+
+async def drop_banned_updates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stop processing updates from banned users before any handler runs."""
+    user = update.effective_user
+    if user is not None and get_user_state(user.id) & BAN:
+        # Answer button presses so the client doesn't keep spinning
+        if update.callback_query:
+            await update.callback_query.answer()
+        raise ApplicationHandlerStop
+
+
+# -----------------------------------------------------------------------------
+# Catalog rendering
+# -----------------------------------------------------------------------------
+
+def render_catalog(kind: str) -> str:
+    """Build the HTML message listing all movies or series.
+
+    Titles are HTML-escaped so that any characters in a title are shown
+    literally instead of being interpreted by Telegram's parser.
+    """
+    items = MOVIES if kind == "movies" else SERIES
+    labels = CATALOG_LABELS[kind]
+    if not items:
+        return labels["empty"]
+    body = "\n\n".join(
+        f"{labels['emoji']} <b>{idx}.</b> <u><b>{html.escape(title)}</b></u>"
+        for idx, title in enumerate(items, 1)
+    )
+    return (
+        f"{labels['header']}\n\n{body}\n\n"
+        f"<b>المجموع: {len(items)} {labels['unit']}</b>"
+    )
+
+
+def catalog_text(kind: str) -> str:
+    """Return the catalog message for `kind`, rendering it only after changes."""
+    if kind not in _rendered_catalog:
+        _rendered_catalog[kind] = render_catalog(kind)
+    return _rendered_catalog[kind]
+
+
+def catalog_keyboard(kind: str, prefix: str) -> InlineKeyboardMarkup:
+    """Return a one-button-per-title keyboard whose callbacks are `prefix<idx>`."""
+    key = (kind, prefix)
+    if key not in _catalog_keyboards:
+        items = MOVIES if kind == "movies" else SERIES
+        _catalog_keyboards[key] = InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"{idx+1}. {title}", callback_data=f"{prefix}{idx}")]
+            for idx, title in enumerate(items)
+        ])
+    return _catalog_keyboards[key]
+
+
+def invalidate_catalog(kind: str) -> None:
+    """Drop the cached message and keyboards for "movies" or "series" after an edit."""
+    _rendered_catalog.pop(kind, None)
+    for key in [key for key in _catalog_keyboards if key[0] == kind]:
+        del _catalog_keyboards[key]
+
+
+async def _send_catalog(sender, kind: str) -> None:
+    """Send the catalog message for `kind` through a reply_text-like `sender`."""
+    await sender(catalog_text(kind), parse_mode='HTML')
+
+
 # -----------------------------------------------------------------------------
 # Command and callback handlers
 # -----------------------------------------------------------------------------
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a welcome message with quick‑action buttons when the user starts."""
-    user_id = update.effective_user.id
-    # If the user is banned, ignore the command
-    if user_id in banned_users:
-        return
     # Craft the welcome message in Arabic
     welcome_text = (
         f"مرحبًا {update.effective_user.first_name}!\n\n"
@@ -357,8 +852,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Provide a list of available commands (admin only)."""
     user_id = update.effective_user.id
-    if user_id in banned_users:
-        return
     if not user_is_admin(user_id):
         await update.message.reply_text("هذا الأمر مخصص للمسؤولين فقط.")
         return
@@ -397,67 +890,50 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def movies_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send the list of movies."""
     user_id = update.effective_user.id
-    if user_id in banned_users:
-        return
-    if user_id in blocked_users:
+    if get_user_state(user_id) & BLOCK:
         await update.message.reply_text(
             "لقد تم حظرك مؤقتًا من استخدام هذا البوت. يرجى التواصل مع الإدارة."
         )
         return
     # Check if movies command is enabled
-    if not command_states.get("movies", True):
+    if not cmd_flags & MOVIES_BIT:
         await update.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
         return
-    # Compose the movie list in modern format
-    if MOVIES:
-        text = "🎬 ***قائمة الأفلام المتاحة***\n\n"
-        for idx, title in enumerate(MOVIES, 1):
-            text += f"🎞️ ***{idx}.*** __**{title}**__\n\n"
-        text += f"***المجموع: {len(MOVIES)} فيلم***"
-    else:
-        text = "🚫 ***لا توجد أفلام متاحة حاليًا***"
-    await update.message.reply_text(text, parse_mode='Markdown')
+    await _send_catalog(update.message.reply_text, "movies")
 
 
 async def series_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send the list of series."""
     user_id = update.effective_user.id
-    if user_id in banned_users:
-        return
-    if user_id in blocked_users:
+    if get_user_state(user_id) & BLOCK:
         await update.message.reply_text(
             "لقد تم حظرك مؤقتًا من استخدام هذا البوت. يرجى التواصل مع الإدارة."
         )
         return
     # Check if series command is enabled
-    if not command_states.get("series", True):
+    if not cmd_flags & SERIES_BIT:
         await update.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
         return
-    if SERIES:
-        text = "📺 ***قائمة المسلسلات المتاحة***\n\n"
-        for idx, title in enumerate(SERIES, 1):
-            text += f"📽️ ***{idx}.*** __**{title}**__\n\n"
-        text += f"***المجموع: {len(SERIES)} مسلسل***"
-    else:
-        text = "🚫 ***لا توجد مسلسلات متاحة حاليًا***"
-    await update.message.reply_text(text, parse_mode='Markdown')
+    await _send_catalog(update.message.reply_text, "series")
 
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Report whether the Captain M website is online or under maintenance."""
     user_id = update.effective_user.id
-    if user_id in banned_users:
-        return
-    if user_id in blocked_users:
+    if get_user_state(user_id) & BLOCK:
         await update.message.reply_text(
             "لقد تم حظرك مؤقتًا من استخدام هذا البوت. يرجى التواصل مع الإدارة."
         )
         return
     # Check if status command is enabled
-    if not command_states.get("status", True):
+    if not cmd_flags & STATUS_BIT:
         await update.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
         return
-    online = fetch_website_status()
+    # The site was switched OFF by an admin via /site - no need to probe it
+    if not site_status:
+        await update.message.reply_text("الموقع تحت الصيانة أو غير متاح في الوقت الحالي.")
+        return
+    online = await fetch_website_status()
     if online:
         text = "الموقع يعمل بشكل طبيعي حاليًا."
     else:
@@ -468,15 +944,13 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def invite_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Return the current invite code."""
     user_id = update.effective_user.id
-    if user_id in banned_users:
-        return
-    if user_id in blocked_users:
+    if get_user_state(user_id) & BLOCK:
         await update.message.reply_text(
             "لقد تم حظرك مؤقتًا من استخدام هذا البوت. يرجى التواصل مع الإدارة."
         )
         return
     # Check if invite command is enabled
-    if not command_states.get("invite", True):
+    if not cmd_flags & INVITE_BIT:
         await update.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
         return
     await update.message.reply_text(f"رمز الدعوة الحالي هو: {invite_code}")
@@ -492,15 +966,13 @@ async def admin_ban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Check if user provided the ID directly with the command
     if context.args and context.args[0].isdigit():
         target_id = int(context.args[0])
-        banned_users.add(target_id)
-        blocked_users.discard(target_id)
-        flagged_users.discard(target_id)
+        await ban_user(target_id)
         await update.message.reply_text(
             f"تم حظر المستخدم برقم {target_id} من استخدام هذا البوت."
         )
     else:
         # Ask for the user ID
-        waiting_for_input[user_id] = "ban"
+        await expect_admin_input(user_id, "ban")
         await update.message.reply_text("اكتب ID المستخدم")
 
 
@@ -514,16 +986,16 @@ async def admin_block(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     # Check if user provided the ID directly with the command
     if context.args and context.args[0].isdigit():
         target_id = int(context.args[0])
-        if target_id in banned_users:
+        if get_user_state(target_id) & BAN:
             await update.message.reply_text("هذا المستخدم محظور بالفعل.")
             return
-        blocked_users.add(target_id)
+        await block_user(target_id)
         await update.message.reply_text(
             f"تم منع المستخدم برقم {target_id} مؤقتًا من استخدام هذا البوت."
         )
     else:
         # Ask for the user ID
-        waiting_for_input[user_id] = "block"
+        await expect_admin_input(user_id, "block")
         await update.message.reply_text("اكتب ID المستخدم")
 
 
@@ -537,13 +1009,13 @@ async def admin_flag(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     # Check if user provided the ID directly with the command
     if context.args and context.args[0].isdigit():
         target_id = int(context.args[0])
-        flagged_users.add(target_id)
+        await flag_user(target_id)
         await update.message.reply_text(
             f"تم وضع علامة على المستخدم برقم {target_id} كمشتبه به للمراجعة."
         )
     else:
         # Ask for the user ID
-        waiting_for_input[user_id] = "flag"
+        await expect_admin_input(user_id, "flag")
         await update.message.reply_text("اكتب ID المستخدم")
 
 
@@ -559,15 +1031,17 @@ async def admin_change_invite(update: Update, context: ContextTypes.DEFAULT_TYPE
     if context.args:
         new_code = context.args[0]
         invite_code = new_code
+        mark_dirty('invite_code')
         await update.message.reply_text(f"تم تحديث رمز الدعوة إلى: {invite_code}")
     else:
         # Ask for the new invite code
-        waiting_for_input[user_id] = "change_invite"
+        await expect_admin_input(user_id, "change_invite")
         await update.message.reply_text("اكتب رمز الدعوة الجديد")
 
 
 async def admin_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Toggle commands on/off (admin only)."""
+    global cmd_flags
     user_id = update.effective_user.id
     if not user_is_admin(user_id):
         await update.message.reply_text("هذا الأمر مخصص للمسؤولين فقط.")
@@ -576,37 +1050,62 @@ async def admin_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if not context.args:
         # Show current status of all commands
         status_text = "حالة الأوامر الحالية:\n\n"
-        for cmd, enabled in command_states.items():
-            status = "مفعل" if enabled else "معطل"
+        for cmd, bit in COMMAND_BITS.items():
+            status = "مفعل" if cmd_flags & bit else "معطل"
             status_text += f"/{cmd}: {status}\n"
         status_text += "\nلتفعيل/تعطيل أمر: /toggle <اسم الأمر>"
         await update.message.reply_text(status_text)
         return
     
     command_name = context.args[0].lower()
-    if command_name in command_states:
-        command_states[command_name] = not command_states[command_name]
-        status = "مفعل" if command_states[command_name] else "معطل"
+    if command_name in COMMAND_BITS:
+        bit = COMMAND_BITS[command_name]
+        cmd_flags ^= bit
+        mark_dirty('command_states')
+        status = "مفعل" if cmd_flags & bit else "معطل"
         await update.message.reply_text(f"تم {status} الأمر /{command_name}")
     else:
         await update.message.reply_text("أمر غير صحيح. الأوامر المتاحة: movies, series, status, invite, help")
 
 
+async def expect_admin_input(user_id: int, command_type: str, extra: Optional[dict] = None) -> None:
+    """Record that the admin's next message is input for `command_type`.
+
+    `extra` is stored in `admin_context` for commands that need it.
+    """
+    async with _input_locks[user_id]:
+        waiting_for_input[user_id] = command_type
+        if extra is not None:
+            admin_context[user_id] = extra
+
+
 async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle admin input when waiting for specific data."""
     user_id = update.effective_user.id
-    if not user_is_admin(user_id) or user_id not in waiting_for_input:
+    if not user_is_admin(user_id):
         return
-    
-    command_type = waiting_for_input[user_id]
+    # Process one input per admin at a time so that concurrent messages
+    # can't consume the same pending command twice
+    async with _input_locks[user_id]:
+        if user_id in waiting_for_input:
+            await process_admin_input(update, context)
+
+
+async def process_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Apply an admin's message to their pending command.
+
+    Must be called with the admin's `_input_locks` entry held.
+    """
+    user_id = update.effective_user.id
+    command_type = waiting_for_input.get(user_id)
+    if command_type is None:
+        return  # expired since handle_admin_input checked it
     user_input = update.message.text.strip()
     
     if command_type == "ban":
         if user_input.isdigit():
             target_id = int(user_input)
-            banned_users.add(target_id)
-            blocked_users.discard(target_id)
-            flagged_users.discard(target_id)
+            await ban_user(target_id)
             await update.message.reply_text(
                 f"تم حظر المستخدم برقم {target_id} من استخدام هذا البوت."
             )
@@ -616,10 +1115,10 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif command_type == "block":
         if user_input.isdigit():
             target_id = int(user_input)
-            if target_id in banned_users:
+            if get_user_state(target_id) & BAN:
                 await update.message.reply_text("هذا المستخدم محظور بالفعل.")
             else:
-                blocked_users.add(target_id)
+                await block_user(target_id)
                 await update.message.reply_text(
                     f"تم منع المستخدم برقم {target_id} مؤقتًا من استخدام هذا البوت."
                 )
@@ -629,7 +1128,7 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif command_type == "flag":
         if user_input.isdigit():
             target_id = int(user_input)
-            flagged_users.add(target_id)
+            await flag_user(target_id)
             await update.message.reply_text(
                 f"تم وضع علامة على المستخدم برقم {target_id} كمشتبه به للمراجعة."
             )
@@ -639,33 +1138,37 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif command_type == "change_invite":
         global invite_code
         invite_code = user_input
-        save_to_database('invite_code', invite_code)  # Save to database
+        mark_dirty('invite_code')
         await update.message.reply_text(f"تم تحديث رمز الدعوة إلى: {invite_code}")
     
     elif command_type == "add_movie_name":
         MOVIES.append(user_input.strip())
-        save_to_database('movies', MOVIES)  # Save to database
+        invalidate_catalog('movies')
+        mark_dirty('movies')
         await update.message.reply_text(f"✅ تم إضافة الفيلم: {user_input.strip()}")
     
     elif command_type == "add_series_name":
         SERIES.append(user_input.strip())
-        save_to_database('series', SERIES)  # Save to database
+        invalidate_catalog('series')
+        mark_dirty('series')
         await update.message.reply_text(f"✅ تم إضافة المسلسل: {user_input.strip()}")
     
     elif command_type == "move_position":
-        if user_id not in admin_context:
+        context = admin_context.get(user_id)
+        if context is None:
             await update.message.reply_text("خطأ: لم يتم العثور على بيانات العملية")
             return
             
         try:
             new_position = int(user_input.strip()) - 1  # Convert to 0-based index
-            context = admin_context[user_id]
             
             if context["action"] == "move_movie":
                 if 0 <= new_position < len(MOVIES):
                     old_idx = context["item_idx"]
                     movie_name = MOVIES.pop(old_idx)
                     MOVIES.insert(new_position, movie_name)
+                    invalidate_catalog('movies')
+                    mark_dirty('movies')
                     await update.message.reply_text(f"✅ تم نقل الفيلم '{movie_name}' إلى الموضع {new_position + 1}")
                 else:
                     await update.message.reply_text(f"موضع غير صحيح. يجب أن يكون بين 1 و {len(MOVIES)}")
@@ -675,6 +1178,8 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     old_idx = context["item_idx"]
                     series_name = SERIES.pop(old_idx)
                     SERIES.insert(new_position, series_name)
+                    invalidate_catalog('series')
+                    mark_dirty('series')
                     await update.message.reply_text(f"✅ تم نقل المسلسل '{series_name}' إلى الموضع {new_position + 1}")
                 else:
                     await update.message.reply_text(f"موضع غير صحيح. يجب أن يكون بين 1 و {len(SERIES)}")
@@ -683,9 +1188,8 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("يرجى إدخال رقم صحيح")
     
     # Remove from waiting list
-    del waiting_for_input[user_id]
-    if user_id in admin_context:
-        del admin_context[user_id]
+    waiting_for_input.pop(user_id, None)
+    admin_context.pop(user_id, None)
 
 
 async def admin_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -759,204 +1263,226 @@ async def admin_site(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     await update.message.reply_text(f"حالة الموقع الحالية: **{current_status}**\n\nاختر الحالة الجديدة:", reply_markup=reply_markup, parse_mode='Markdown')
 
 
+async def _cb_movies(query, user_id: int) -> None:
+    """Inline button: send the movie list."""
+    if not cmd_flags & MOVIES_BIT:
+        await query.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
+        return
+    await _send_catalog(query.message.reply_text, "movies")
+
+
+async def _cb_series(query, user_id: int) -> None:
+    """Inline button: send the series list."""
+    if not cmd_flags & SERIES_BIT:
+        await query.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
+        return
+    await _send_catalog(query.message.reply_text, "series")
+
+
+async def _cb_status(query, user_id: int) -> None:
+    """Inline button: report whether the website is reachable."""
+    if not cmd_flags & STATUS_BIT:
+        await query.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
+        return
+
+    if site_status:
+        # Normal behavior - check actual website (cached, see probe_website)
+        status_code = await probe_website()
+        if status_code is None:
+            text = "❌ الموقع تحت الصيانة أو غير متاح في الوقت الحالي."
+        elif status_code == 200:
+            text = "🔴 الموقع يعمل بشكل طبيعي وقابل للوصول."
+        else:
+            text = "الموقع يعمل بكفاءه."
+    else:
+        # Site is set to OFF - always show as down
+        text = "❌ الموقع تحت الصيانة أو غير متاح في الوقت الحالي."
+
+    await query.message.reply_text(text)
+
+
+async def _cb_ticket(query, user_id: int) -> None:
+    """Inline button: show the ticket category picker."""
+    # Respect the block list
+    if get_user_state(user_id) & BLOCK:
+        await query.message.reply_text(
+            "لقد تم حظرك مؤقتًا من استخدام هذا البوت. يرجى التواصل مع الإدارة."
+        )
+        return
+    # Show category options
+    await query.message.reply_text(
+        "اختر نوع التذكرة التي تريد إرسالها:",
+        reply_markup=TICKET_CATEGORY_KEYBOARD
+    )
+
+
+async def _cb_add_movie(query, user_id: int) -> None:
+    """Admin button: ask for the name of a movie to add."""
+    if not user_is_admin(user_id):
+        return
+    await expect_admin_input(user_id, "add_movie_name")
+    await query.message.reply_text("اكتب اسم الفيلم الجديد:")
+
+
+async def _cb_add_series(query, user_id: int) -> None:
+    """Admin button: ask for the name of a series to add."""
+    if not user_is_admin(user_id):
+        return
+    await expect_admin_input(user_id, "add_series_name")
+    await query.message.reply_text("اكتب اسم المسلسل الجديد:")
+
+
+async def _cb_remove_movie(query, user_id: int) -> None:
+    """Admin button: show the movies to pick one for deletion."""
+    if not user_is_admin(user_id) or not MOVIES:
+        if not MOVIES:
+            await query.message.reply_text("لا توجد أفلام لحذفها")
+        return
+    reply_markup = catalog_keyboard("movies", "del_movie_")
+    await query.message.reply_text("اختر الفيلم الذي تريد حذفه:", reply_markup=reply_markup)
+
+
+async def _cb_remove_series(query, user_id: int) -> None:
+    """Admin button: show the series to pick one for deletion."""
+    if not user_is_admin(user_id) or not SERIES:
+        if not SERIES:
+            await query.message.reply_text("لا توجد مسلسلات لحذفها")
+        return
+    reply_markup = catalog_keyboard("series", "del_series_")
+    await query.message.reply_text("اختر المسلسل الذي تريد حذفه:", reply_markup=reply_markup)
+
+
+async def _cb_move_movie(query, user_id: int) -> None:
+    """Admin button: show the movies to pick one to move."""
+    if not user_is_admin(user_id) or not MOVIES:
+        if not MOVIES:
+            await query.message.reply_text("لا توجد أفلام لتحريكها")
+        return
+    reply_markup = catalog_keyboard("movies", "move_movie_")
+    await query.message.reply_text("اختر الفيلم الذي تريد تحريكه:", reply_markup=reply_markup)
+
+
+async def _cb_move_series(query, user_id: int) -> None:
+    """Admin button: show the series to pick one to move."""
+    if not user_is_admin(user_id) or not SERIES:
+        if not SERIES:
+            await query.message.reply_text("لا توجد مسلسلات لتحريكها")
+        return
+    reply_markup = catalog_keyboard("series", "move_series_")
+    await query.message.reply_text("اختر المسلسل الذي تريد تحريكه:", reply_markup=reply_markup)
+
+
+async def _cb_site_on(query, user_id: int) -> None:
+    """Admin button: report the website as online in /status."""
+    global site_status
+    if not user_is_admin(user_id):
+        return
+    site_status = True
+    mark_dirty('site_status')
+    await query.message.reply_text("✅ تم تفعيل الموقع - سيظهر كمعتاد عند فحص حالة الموقع")
+
+
+async def _cb_site_off(query, user_id: int) -> None:
+    """Admin button: report the website as down in /status."""
+    global site_status
+    if not user_is_admin(user_id):
+        return
+    site_status = False
+    mark_dirty('site_status')
+    await query.message.reply_text("❌ تم إيقاف الموقع - سيظهر كمعطل عند فحص حالة الموقع")
+
+
+async def _cb_del_movie(query, user_id: int, idx: int) -> None:
+    """Admin picker: delete the movie at `idx`."""
+    if not user_is_admin(user_id):
+        return
+    if 0 <= idx < len(MOVIES):
+        deleted_movie = MOVIES.pop(idx)
+        invalidate_catalog('movies')
+        mark_dirty('movies')
+        await query.message.reply_text(f"تم حذف الفيلم: {deleted_movie}")
+
+
+async def _cb_del_series(query, user_id: int, idx: int) -> None:
+    """Admin picker: delete the series at `idx`."""
+    if not user_is_admin(user_id):
+        return
+    if 0 <= idx < len(SERIES):
+        deleted_series = SERIES.pop(idx)
+        invalidate_catalog('series')
+        mark_dirty('series')
+        await query.message.reply_text(f"تم حذف المسلسل: {deleted_series}")
+
+
+async def _cb_move_movie_idx(query, user_id: int, idx: int) -> None:
+    """Admin picker: ask for the new position of the movie at `idx`."""
+    if not user_is_admin(user_id):
+        return
+    if 0 <= idx < len(MOVIES):
+        await expect_admin_input(
+            user_id,
+            "move_position",
+            {"action": "move_movie", "item_idx": idx, "item_name": MOVIES[idx]},
+        )
+        await query.message.reply_text(f"اكتب الموضع الجديد للفيلم '{MOVIES[idx]}' (من 1 إلى {len(MOVIES)}):")
+
+
+async def _cb_move_series_idx(query, user_id: int, idx: int) -> None:
+    """Admin picker: ask for the new position of the series at `idx`."""
+    if not user_is_admin(user_id):
+        return
+    if 0 <= idx < len(SERIES):
+        await expect_admin_input(
+            user_id,
+            "move_position",
+            {"action": "move_series", "item_idx": idx, "item_name": SERIES[idx]},
+        )
+        await query.message.reply_text(f"اكتب الموضع الجديد للمسلسل '{SERIES[idx]}' (من 1 إلى {len(SERIES)}):")
+
+
+# Callback data that names an action outright, e.g. "movies" or "site_on".
+CALLBACK_ACTIONS = {
+    "movies": _cb_movies,
+    "series": _cb_series,
+    "status": _cb_status,
+    "ticket": _cb_ticket,
+    "add_movie": _cb_add_movie,
+    "add_series": _cb_add_series,
+    "remove_movie": _cb_remove_movie,
+    "remove_series": _cb_remove_series,
+    "move_movie": _cb_move_movie,
+    "move_series": _cb_move_series,
+    "site_on": _cb_site_on,
+    "site_off": _cb_site_off,
+}
+
+# Callback data of the form "<prefix><index>" produced by catalog_keyboard().
+CALLBACK_ITEM_ACTIONS = (
+    ("del_movie_", _cb_del_movie),
+    ("del_series_", _cb_del_series),
+    ("move_movie_", _cb_move_movie_idx),
+    ("move_series_", _cb_move_series_idx),
+)
+
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle button presses from the inline keyboard."""
-    global site_status
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    # Ignore interactions from banned users
-    if user_id in banned_users:
+    data = query.data
+    action = CALLBACK_ACTIONS.get(data)
+    if action is not None:
+        await action(query, user_id)
         return
-    if query.data == "movies":
-        if not command_states.get("movies", True):
-            await query.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
-            return
-        # Use modern format for inline callback
-        if MOVIES:
-            text = "🎬 ***قائمة الأفلام المتاحة***\n\n"
-            for idx, title in enumerate(MOVIES, 1):
-                text += f"🎞️ ***{idx}.*** __**{title}**__\n\n"
-            text += f"***المجموع: {len(MOVIES)} فيلم***"
-        else:
-            text = "🚫 ***لا توجد أفلام متاحة حاليًا***"
-        await query.message.reply_text(text, parse_mode='Markdown')
-    elif query.data == "series":
-        if not command_states.get("series", True):
-            await query.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
-            return
-        if SERIES:
-            text = "📺 ***قائمة المسلسلات المتاحة***\n\n"
-            for idx, title in enumerate(SERIES, 1):
-                text += f"📽️ ***{idx}.*** __**{title}**__\n\n"
-            text += f"***المجموع: {len(SERIES)} مسلسل***"
-        else:
-            text = "🚫 ***لا توجد مسلسلات متاحة حاليًا***"
-        await query.message.reply_text(text, parse_mode='Markdown')
-    elif query.data == "status":
-        if not command_states.get("status", True):
-            await query.message.reply_text("هذا الأمر معطل حاليًا من قبل الإدارة.")
-            return
-        
-        if site_status:
-            # Normal behavior - check actual website
-            try:
-                response = requests.get("https://captainm.netlify.app", timeout=10)
-                if response.status_code == 200:
-                    text = "🔴 الموقع يعمل بشكل طبيعي وقابل للوصول."
-                else:
-                    text = "الموقع يعمل بكفاءه."
-            except requests.exceptions.RequestException:
-                text = "❌ الموقع تحت الصيانة أو غير متاح في الوقت الحالي."
-        else:
-            # Site is set to OFF - always show as down
-            text = "❌ الموقع تحت الصيانة أو غير متاح في الوقت الحالي."
-        
-        await query.message.reply_text(text)
-    
-    elif query.data == "ticket":
-        # Respect existing ban/block lists
-        if user_id in blocked_users:
-            await query.message.reply_text(
-                "لقد تم حظرك مؤقتًا من استخدام هذا البوت. يرجى التواصل مع الإدارة."
-            )
-            return
-        # Show category options
-        keyboard = [
-            [InlineKeyboardButton("💡 اقتراح", callback_data="ticket_suggestion")],
-            [InlineKeyboardButton("⚠️ بلاغ", callback_data="ticket_report")],
-            [InlineKeyboardButton("📩 تحدث مع المالك", callback_data="ticket_owner")],
-        ]
-        await query.message.reply_text(
-            "اختر نوع التذكرة التي تريد إرسالها:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-    
-    # Handle admin operations
-    elif query.data == "add_movie":
-        if not user_is_admin(user_id):
-            return
-        waiting_for_input[user_id] = "add_movie_name"
-        await query.message.reply_text("اكتب اسم الفيلم الجديد:")
-    
-    elif query.data == "add_series":
-        if not user_is_admin(user_id):
+    for prefix, item_action in CALLBACK_ITEM_ACTIONS:
+        if data.startswith(prefix):
+            await item_action(query, user_id, int(data[len(prefix):]))
             return
-        waiting_for_input[user_id] = "add_series_name"
-        await query.message.reply_text("اكتب اسم المسلسل الجديد:")
-    
-    elif query.data == "remove_movie":
-        if not user_is_admin(user_id) or not MOVIES:
-            if not MOVIES:
-                await query.message.reply_text("لا توجد أفلام لحذفها")
-            return
-        
-        # Create buttons for each movie
-        keyboard = []
-        for idx, movie in enumerate(MOVIES):
-            keyboard.append([InlineKeyboardButton(f"{idx+1}. {movie}", callback_data=f"del_movie_{idx}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("اختر الفيلم الذي تريد حذفه:", reply_markup=reply_markup)
-    
-    elif query.data == "remove_series":
-        if not user_is_admin(user_id) or not SERIES:
-            if not SERIES:
-                await query.message.reply_text("لا توجد مسلسلات لحذفها")
-            return
-        
-        # Create buttons for each series
-        keyboard = []
-        for idx, series in enumerate(SERIES):
-            keyboard.append([InlineKeyboardButton(f"{idx+1}. {series}", callback_data=f"del_series_{idx}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("اختر المسلسل الذي تريد حذفه:", reply_markup=reply_markup)
-    
-    elif query.data == "move_movie":
-        if not user_is_admin(user_id) or not MOVIES:
-            if not MOVIES:
-                await query.message.reply_text("لا توجد أفلام لتحريكها")
-            return
-        
-        # Create buttons for each movie
-        keyboard = []
-        for idx, movie in enumerate(MOVIES):
-            keyboard.append([InlineKeyboardButton(f"{idx+1}. {movie}", callback_data=f"move_movie_{idx}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("اختر الفيلم الذي تريد تحريكه:", reply_markup=reply_markup)
-    
-    elif query.data == "move_series":
-        if not user_is_admin(user_id) or not SERIES:
-            if not SERIES:
-                await query.message.reply_text("لا توجد مسلسلات لتحريكها")
-            return
-        
-        # Create buttons for each series
-        keyboard = []
-        for idx, series in enumerate(SERIES):
-            keyboard.append([InlineKeyboardButton(f"{idx+1}. {series}", callback_data=f"move_series_{idx}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text("اختر المسلسل الذي تريد تحريكه:", reply_markup=reply_markup)
-    
-    # Handle delete operations
-    elif query.data.startswith("del_movie_"):
-        if not user_is_admin(user_id):
-            return
-        idx = int(query.data.split("_")[2])
-        if 0 <= idx < len(MOVIES):
-            deleted_movie = MOVIES.pop(idx)
-            await query.message.reply_text(f"تم حذف الفيلم: {deleted_movie}")
-    
-    elif query.data.startswith("del_series_"):
-        if not user_is_admin(user_id):
-            return
-        idx = int(query.data.split("_")[2])
-        if 0 <= idx < len(SERIES):
-            deleted_series = SERIES.pop(idx)
-            await query.message.reply_text(f"تم حذف المسلسل: {deleted_series}")
-    
-    # Handle move operations
-    elif query.data.startswith("move_movie_"):
-        if not user_is_admin(user_id):
-            return
-        idx = int(query.data.split("_")[2])
-        if 0 <= idx < len(MOVIES):
-            admin_context[user_id] = {"action": "move_movie", "item_idx": idx, "item_name": MOVIES[idx]}
-            waiting_for_input[user_id] = "move_position"
-            await query.message.reply_text(f"اكتب الموضع الجديد للفيلم '{MOVIES[idx]}' (من 1 إلى {len(MOVIES)}):")
-    
-    elif query.data.startswith("move_series_"):
-        if not user_is_admin(user_id):
-            return
-        idx = int(query.data.split("_")[2])
-        if 0 <= idx < len(SERIES):
-            admin_context[user_id] = {"action": "move_series", "item_idx": idx, "item_name": SERIES[idx]}
-            waiting_for_input[user_id] = "move_position"
-            await query.message.reply_text(f"اكتب الموضع الجديد للمسلسل '{SERIES[idx]}' (من 1 إلى {len(SERIES)}):")
-    
-    # Handle site status changes
-    elif query.data == "site_on":
-        if not user_is_admin(user_id):
-            return
-        site_status = True
-        save_to_database('site_status', site_status)  # Save to database
-        await query.message.reply_text("✅ تم تفعيل الموقع - سيظهر كمعتاد عند فحص حالة الموقع")
-    
-    elif query.data == "site_off":
-        if not user_is_admin(user_id):
-            return
-        site_status = False
-        save_to_database('site_status', site_status)  # Save to database
-        await query.message.reply_text("❌ تم إيقاف الموقع - سيظهر كمعطل عند فحص حالة الموقع")
 
 
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Respond to unknown commands politely."""
-    if update.effective_user.id in banned_users:
-        return
     await update.message.reply_text("عذرًا، لم أفهم هذا الأمر. استخدم /help لمعرفة الأوامر المتاحة.")
 
 
@@ -964,82 +1490,160 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 # Ticketing System Functions
 # ---------------------------------------------------------------------------
 
+def create_ticket(user_id: int, user_link: str, category: str, message: str) -> int:
+    """Store a new open ticket and return its id."""
+    global _next_ticket_id
+    ticket_id = max(time.time_ns(), _next_ticket_id)
+    _next_ticket_id = ticket_id + 1
+    tickets[ticket_id] = {
+        "id": ticket_id,
+        "user_id": user_id,
+        "user_link": user_link,
+        "category": category,
+        "message": message,
+        "timestamp": datetime.now(TICKET_TZ).strftime("%Y-%m-%d %H:%M"),
+        "closed": False,
+    }
+    open_tickets.add(ticket_id)
+    ticket_users.setdefault(user_id, user_link)
+    return ticket_id
+
+
+def close_ticket(ticket_id: int) -> Optional[Dict[str, Any]]:
+    """Mark an open ticket as closed.
+
+    Returns the ticket, or None if it doesn't exist or was already closed.
+    """
+    if ticket_id not in open_tickets:
+        return None
+    open_tickets.discard(ticket_id)
+    ticket = tickets[ticket_id]
+    ticket["closed"] = True
+    return ticket
+
+
+def clear_closed_tickets() -> int:
+    """Delete all closed tickets in place and return how many were removed."""
+    closed_ids = tickets.keys() - open_tickets
+    for ticket_id in closed_ids:
+        del tickets[ticket_id]
+    if closed_ids:
+        index_ticket_users()
+    return len(closed_ids)
+
+
+def index_ticket_users() -> None:
+    """Rebuild `ticket_users` from the current tickets."""
+    global ticket_users
+    ticket_users = {}
+    for t in tickets.values():
+        ticket_users.setdefault(t["user_id"], t["user_link"])
+
+
+def serialize_tickets() -> Dict[str, Any]:
+    """Return the tickets in the JSON form stored in the database."""
+    return {"next_id": _next_ticket_id, "tickets": list(tickets.values())}
+
+
+def load_tickets(stored) -> None:
+    """Replace the in-memory tickets with data from `serialize_tickets()`.
+
+    Also accepts the plain list of tickets with string ids saved by older
+    versions.
+    """
+    global tickets, open_tickets, _next_ticket_id
+    if isinstance(stored, list):
+        stored = {"next_id": 1, "tickets": stored}
+    tickets = {}
+    for ticket in stored["tickets"]:
+        ticket["id"] = int(ticket["id"])
+        tickets[ticket["id"]] = ticket
+    open_tickets = {tid for tid, t in tickets.items() if not t.get("closed")}
+    index_ticket_users()
+    _next_ticket_id = max(stored["next_id"], max(tickets, default=0) + 1)
+
+
+async def notify_admins(bot, **kwargs) -> None:
+    """Send the same message to every admin.
+
+    `kwargs` are passed to `bot.send_message` for the first admin that can
+    be reached; the rest receive a server-side copy of that message,
+    concurrently.  Failed sends are ignored.
+    """
+    admin_ids = list(ADMIN_IDS)
+    for idx, source_id in enumerate(admin_ids):
+        try:
+            sent = await bot.send_message(chat_id=source_id, **kwargs)
+            break
+        except Exception:
+            # In case sending fails, try the next admin
+            continue
+    else:
+        return
+
+    async def copy(admin_id: int) -> None:
+        async with _send_semaphore:
+            try:
+                await bot.copy_message(
+                    chat_id=admin_id,
+                    from_chat_id=source_id,
+                    message_id=sent.message_id,
+                    reply_markup=kwargs.get("reply_markup"),
+                )
+            except Exception:
+                # In case sending fails, we ignore the error
+                pass
+
+    await asyncio.gather(*(copy(admin_id) for admin_id in admin_ids[idx + 1:]))
+
+
 async def ticket_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Allow a user to create a ticket by choosing a category."""
     user_id = update.effective_user.id
-    # Respect existing ban/block lists
-    if user_id in banned_users:
-        return
-    if user_id in blocked_users:
+    # Respect the block list
+    if get_user_state(user_id) & BLOCK:
         await update.message.reply_text(
             "لقد تم حظرك مؤقتًا من استخدام هذا البوت. يرجى التواصل مع الإدارة."
         )
         return
     # Show category options
-    keyboard = [
-        [InlineKeyboardButton("💡 اقتراح", callback_data="ticket_suggestion")],
-        [InlineKeyboardButton("⚠️ بلاغ", callback_data="ticket_report")],
-        [InlineKeyboardButton("📩 تحدث مع المالك", callback_data="ticket_owner")],
-    ]
     await update.message.reply_text(
         "اختر نوع التذكرة التي تريد إرسالها:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=TICKET_CATEGORY_KEYBOARD
     )
 
 
 async def handle_ticket_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Capture the user's message when they are creating a ticket."""
     user_id = update.effective_user.id
-    # Only handle this message if we're expecting a ticket from the user
-    if user_id in waiting_for_ticket:
-        # Pop the category to avoid processing extra messages
-        category = waiting_for_ticket.pop(user_id)
+    # Only handle this message if we're expecting a ticket from the user.
+    # Pop the category to avoid processing extra messages.
+    category = waiting_for_ticket.pop(user_id, None)
+    if category is not None:
         message_text = update.message.text.strip()
-        # Create a unique ticket ID using the current timestamp (milliseconds)
-        now = datetime.now(ZoneInfo("Africa/Cairo"))
-        ticket_id = str(int(now.timestamp() * 1000))
         # Build a clickable link for the user
         user_link = f"[{update.effective_user.first_name}](tg://user?id={user_id})"
         # Create the ticket record
-        ticket = {
-            "id": ticket_id,
-            "user_id": user_id,
-            "user_link": user_link,
-            "category": category,
-            "message": message_text,
-            "timestamp": now.strftime("%Y-%m-%d %H:%M"),
-            "closed": False,
-        }
-        tickets.append(ticket)
+        ticket_id = create_ticket(user_id, user_link, category, message_text)
+        ticket = tickets[ticket_id]
         # Persist tickets
-        save_to_database('tickets', tickets)
+        mark_tickets_dirty(context.job_queue)
         # Confirm to the user
         await update.message.reply_text(
             "✅ تم إرسال تذكرتك بنجاح! سنتواصل معك قريبًا.",
             parse_mode='Markdown'
         )
         # Forward to admins (owners).  Each admin receives a button to close the ticket.
-        text = (
-            "🎟️ **تذكرة جديدة**\n\n"
-            f"**النوع:** {category}\n"
-            f"**المرسل:** {user_link}\n"
-            f"**الوقت:** {ticket['timestamp']}\n"
-            f"**الرسالة:**\n{message_text}"
-        )
+        text = NEW_TICKET_TEMPLATE.format_map(ticket)
         reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔒 إغلاق التذكرة", callback_data=f"close_ticket_{ticket_id}")]
+            [InlineKeyboardButton(CLOSE_TICKET_LABEL, callback_data=f"close_ticket_{ticket_id}")]
         ])
-        for admin_id in ADMIN_IDS:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=text,
-                    reply_markup=reply_markup,
-                    parse_mode='Markdown'
-                )
-            except Exception:
-                # In case sending fails, we ignore the error
-                pass
+        await notify_admins(
+            context.bot,
+            text=text,
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
     else:
         # If this message isn't part of a ticket, fall back to existing admin handler
         await handle_admin_input(update, context)
@@ -1054,19 +1658,19 @@ async def admin_view_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not tickets:
         await update.message.reply_text("لا توجد تذاكر حالياً.")
         return
-    lines = []
-    for idx, t in enumerate(tickets, 1):
-        status = "✅ مغلقة" if t.get("closed") else "🕒 مفتوحة"
-        lines.append(
-            f"{idx}. {t['user_link']} - {t['category']} - {t['timestamp']} - {status}"
-        )
-    msg = "📄 **قائمة التذاكر**\n\n" + "\n".join(lines)
-    keyboard = [
-        [InlineKeyboardButton("🧹 حذف التذاكر المغلقة", callback_data="clear_closed_tickets")]
-    ]
+    lines = (
+        f"{idx}. {t['user_link']} - {t['category']} - {t['timestamp']} - "
+        f"{'✅ مغلقة' if t.get('closed') else '🕒 مفتوحة'}"
+        for idx, t in enumerate(tickets.values(), 1)
+    )
+    chunks = list(chunk_lines(itertools.chain(("📄 **قائمة التذاكر**", ""), lines)))
+    # Sent one after another so the list arrives in order; only the last
+    # message carries the clear button.
+    for chunk in chunks[:-1]:
+        await update.message.reply_text(chunk, parse_mode='Markdown')
     await update.message.reply_text(
-        msg,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        chunks[-1],
+        reply_markup=CLEAR_CLOSED_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -1080,16 +1684,9 @@ async def admin_view_ticket_users(update: Update, context: ContextTypes.DEFAULT_
     if not tickets:
         await update.message.reply_text("لا توجد تذاكر حالياً.")
         return
-    unique_links: List[str] = []
-    seen_ids = set()
-    for t in tickets:
-        if t['user_id'] not in seen_ids:
-            seen_ids.add(t['user_id'])
-            unique_links.append(t['user_link'])
-    msg = "👥 **المستخدمون الذين أرسلوا تذاكر:**\n\n" + "\n".join(
-        [f"{idx + 1}. {link}" for idx, link in enumerate(unique_links)]
-    )
-    await update.message.reply_text(msg, parse_mode='Markdown')
+    lines = (f"{idx}. {link}" for idx, link in enumerate(ticket_users.values(), 1))
+    for chunk in chunk_lines(itertools.chain(("👥 **المستخدمون الذين أرسلوا تذاكر:**", ""), lines)):
+        await update.message.reply_text(chunk, parse_mode='Markdown')
 
 
 async def admin_pending_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1098,7 +1695,7 @@ async def admin_pending_tickets(update: Update, context: ContextTypes.DEFAULT_TY
     if not user_is_admin(user_id):
         await update.message.reply_text("هذا الأمر مخصص للمسؤولين فقط.")
         return
-    open_count = sum(1 for t in tickets if not t.get("closed"))
+    open_count = len(open_tickets)
     if open_count == 0:
         msg = "✅ لا توجد تذاكر بحاجة إلى رد."
     else:
@@ -1115,23 +1712,18 @@ async def handle_ticket_callback(update: Update, context: ContextTypes.DEFAULT_T
     """
     query = update.callback_query
     await query.answer()
-    data = query.data
     user_id = query.from_user.id
+    match = context.matches[0]
     # User chooses the type of ticket
-    if data.startswith("ticket_"):
-        category = data.split("_", 1)[1]
-        waiting_for_ticket[user_id] = category
+    if match.lastgroup == "category":
+        waiting_for_ticket[user_id] = match["category"]
         await query.message.reply_text("✉️ يرجى كتابة رسالتك الآن:")
     # Admin clicks "close ticket"
-    elif data.startswith("close_ticket_"):
-        ticket_id = data[len("close_ticket_"):]
-        target_user_id = None
-        for t in tickets:
-            if t["id"] == ticket_id and not t.get("closed"):
-                t["closed"] = True
-                target_user_id = t["user_id"]
-                break
-        save_to_database('tickets', tickets)
+    elif match.lastgroup == "ticket_id":
+        ticket = close_ticket(int(match["ticket_id"]))
+        target_user_id = ticket["user_id"] if ticket else None
+        if ticket:
+            mark_tickets_dirty(context.job_queue)
         # Edit the original admin message or send a new one confirming closure
         try:
             await query.edit_message_text("🔒 تم إغلاق التذكرة.", parse_mode='Markdown')
@@ -1148,10 +1740,9 @@ async def handle_ticket_callback(update: Update, context: ContextTypes.DEFAULT_T
             except Exception:
                 pass
     # Admin clicks "clear closed tickets"
-    elif data == "clear_closed_tickets":
-        # Filter out closed tickets
-        tickets[:] = [t for t in tickets if not t.get("closed")]
-        save_to_database('tickets', tickets)
+    else:
+        if clear_closed_tickets():
+            mark_tickets_dirty(context.job_queue)
         await query.message.reply_text("🧹 تم حذف التذاكر المغلقة.")
 
 
@@ -1176,8 +1767,37 @@ def main() -> None:
             "Please set your Telegram bot token in the TOKEN variable or as the BOT_TOKEN environment variable."
         )
 
-    # Create the application instance
-    application = Application.builder().token(TOKEN).build()
+    # Create the application instance.  The default Bot API pool holds only
+    # a handful of connections; size it so bursts of replies and admin
+    # notifications don't fail with "pool is occupied" errors, and wait up
+    # to 30 seconds for a free connection instead of the default 1 second.
+    # Outgoing calls use HTTP/2 so concurrent sends share one multiplexed
+    # TLS connection.  getUpdates gets its own small pool so long polling
+    # never competes with outgoing messages.
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .request(HTTPXRequest(connection_pool_size=256, pool_timeout=30.0, http_version="2"))
+        .get_updates_request(HTTPXRequest(connection_pool_size=16, pool_timeout=30.0))
+        # No message links to anything worth previewing, so skip previews
+        # for every send instead of passing the flag per call
+        .defaults(Defaults(disable_web_page_preview=True))
+        # Handle updates concurrently so a slow handler (e.g. a database
+        # write) doesn't hold up everyone else's requests
+        .concurrent_updates(True)
+        .post_stop(flush_dirty_data)
+        .post_shutdown(close_http_client)
+        .build()
+    )
+
+    # Periodically persist changes recorded with mark_dirty()
+    application.job_queue.run_repeating(flush_dirty_data, interval=DIRTY_FLUSH_INTERVAL)
+    # Keep the website probe warm so /status never waits on the network
+    application.job_queue.run_repeating(refresh_site_probe, interval=STATUS_REFRESH_INTERVAL, first=0)
+
+    # Banned users are ignored entirely: this runs first and stops all
+    # further handling of their updates
+    application.add_handler(TypeHandler(Update, drop_banned_updates), group=-1)
 
     # Register command handlers
     application.add_handler(CommandHandler("start", start))
@@ -1200,7 +1820,7 @@ def main() -> None:
     application.add_handler(CommandHandler("pending_tickets", admin_pending_tickets))
 
     # Callback query handlers for inline buttons
-    application.add_handler(CallbackQueryHandler(handle_ticket_callback, pattern="^(ticket_|close_ticket_|clear_closed_tickets)"))
+    application.add_handler(CallbackQueryHandler(handle_ticket_callback, pattern=TICKET_CALLBACK_PATTERN))
     application.add_handler(CallbackQueryHandler(handle_callback))
 
     # Admin management commands
@@ -1216,8 +1836,16 @@ def main() -> None:
     # Unknown command handler should be last
     application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
 
-    # Start the bot
-    application.run_polling()
+    # Start the bot.  The webhook path is the token so only Telegram knows it.
+    if WEBHOOK_URL:
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TOKEN}",
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":